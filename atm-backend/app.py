@@ -1,18 +1,302 @@
 # app.py - Backend dung CSV, 3 tuyen, khong OSRM
 
-from fastapi import FastAPI, HTTPException
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Dict, List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Literal
 from pathlib import Path
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import queue
+import threading
+import time
+import uuid
 
+import numpy as np
 import pandas as pd
-from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+import solver
+from metrics import SERVER_TIMING, Counter, Gauge, Histogram, Registry, observe_stage, server_timing_header, timed
+from matrix_builder import MatrixBuilder, calibrate_detour, load_locations
+from spatial_index import SpatialIndex
+
+# Folder cha: .../AppBIDV (app.py nam trong .../AppBIDV/atm-backend/)
+BASE = Path(__file__).resolve().parents[1]
+
+DEFAULT_FILES = {
+    "Tuyen1": "Distance_Matrix_Tuyến1.csv",
+    "Tuyen2": "Distance_Matrix_Tuyến2.csv",
+    "Tuyen3": "Distance_Matrix_Tuyến3.csv",
+}
+DEFAULT_DEPOTS = {
+    "Tuyen1": 1,
+    "Tuyen2": 2,
+    "Tuyen3": 3,
+}
+
+# thu muc luu ban nhi phan (.npy, mo bang mmap) cua cac ma tran; "" = tat
+MATRIX_CACHE_DIR = os.getenv("MATRIX_CACHE_DIR", str(Path(__file__).resolve().parent / ".matrix_cache"))
+
+# toa do ATM/depot cho che do source="coords" (ma tran tinh tu haversine)
+LOCATIONS_FILE = os.getenv("LOCATIONS_FILE", str(BASE / "ATM_Location_Last.jsonl"))
+# he so duong vong; "" = tu hieu chinh theo cac CSV mac dinh
+DETOUR_FACTOR = os.getenv("DETOUR_FACTOR", "")
+# tong dung luong (MB) cac ma tran tinh tu toa do duoc BUILDER nho lai
+MATRIX_BUILD_CACHE_MB = float(os.getenv("MATRIX_BUILD_CACHE_MB", "256"))
+
+
+# ---------- Kho ma tran khoang cach ----------
+@dataclass
+class DistanceMatrix:
+    path: Path
+    ids: List[str]              # id theo thu tu dong/cot
+    index: Dict[str, int]       # id -> so dong
+    values: np.ndarray          # int32 (N, N), co the la memmap
+    mtime: float
+    sha256: str
+
+    def subset(self, want: List[str]) -> np.ndarray:
+        """Cat ma tran con theo danh sach id (dung mang chi so, khong tao DataFrame)."""
+        idx = np.fromiter((self.index[x] for x in want), dtype=np.intp, count=len(want))
+        return self.values[np.ix_(idx, idx)]
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MatrixStore:
+    """
+    Nap moi ma tran CSV mot lan thanh mang int32 + bang id -> chi so.
+    Tu nap lai khi mtime/hash cua file CSV thay doi. Neu co cache_dir thi
+    luu ban .npy va lan sau mo lai bang mmap thay vi parse CSV.
+    """
+
+    def __init__(self, cache_dir: str | Path | None = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._items: Dict[Path, DistanceMatrix] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """So ma tran dang nap."""
+        with self._lock:
+            return len(self._items)
+
+    def get(self, csv_file: str | Path) -> DistanceMatrix:
+        path = Path(csv_file).resolve()
+        if not path.exists():
+            raise HTTPException(status_code=400, detail=f"CSV not found: {csv_file}")
+
+        mtime = path.stat().st_mtime
+        with self._lock:
+            cur = self._items.get(path)
+            if cur is not None and cur.mtime == mtime:
+                return cur
+
+            sha = _file_sha256(path)
+            if cur is not None and cur.sha256 == sha:
+                # chi doi mtime, noi dung giu nguyen
+                cur.mtime = mtime
+                return cur
+
+            mat = self._open_binary(path, sha)
+            if mat is None:
+                mat = self._load_csv(path, sha)
+                self._save_binary(mat)
+            mat.mtime = mtime
+            self._items[path] = mat
+            return mat
+
+    def preload(self, csv_files) -> None:
+        for f in csv_files:
+            try:
+                self.get(f)
+            except HTTPException:
+                pass  # file thieu: bao loi luc request
+
+    def _load_csv(self, path: Path, sha: str) -> DistanceMatrix:
+        df = pd.read_csv(path, index_col=0)
+        ids = [str(x) for x in df.index]
+        cols = [str(x) for x in df.columns]
+        if cols != ids:
+            # cot sap xep khac dong -> dua ve cung thu tu voi dong
+            df.columns = cols
+            df = df.loc[:, ids]
+        # int() cua ban cu cat phan thap phan -> astype cung cat ve 0
+        values = np.ascontiguousarray(df.to_numpy(dtype=np.float64).astype(np.int32))
+        return DistanceMatrix(path, ids, {x: i for i, x in enumerate(ids)}, values, 0.0, sha)
+
+    def _binary_paths(self, path: Path, sha: str) -> tuple[Path, Path]:
+        stem = f"{path.stem}.{sha[:16]}"
+        return self.cache_dir / f"{stem}.npy", self.cache_dir / f"{stem}.ids.json"
+
+    def _save_binary(self, mat: DistanceMatrix) -> None:
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            npy, ids_file = self._binary_paths(mat.path, mat.sha256)
+            np.save(npy, mat.values)
+            ids_file.write_text(json.dumps(mat.ids), encoding="utf-8")
+        except OSError:
+            pass  # cache chi la toi uu, khong bat buoc
+
+    def _open_binary(self, path: Path, sha: str) -> DistanceMatrix | None:
+        if self.cache_dir is None:
+            return None
+        npy, ids_file = self._binary_paths(path, sha)
+        if not (npy.exists() and ids_file.exists()):
+            return None
+        try:
+            values = np.load(npy, mmap_mode="r")
+            ids = json.loads(ids_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if values.dtype != np.int32 or values.shape != (len(ids), len(ids)):
+            return None
+        return DistanceMatrix(path, ids, {x: i for i, x in enumerate(ids)}, values, 0.0, sha)
+
+
+STORE = MatrixStore(MATRIX_CACHE_DIR or None)
+
+BUILDER: MatrixBuilder | None = None
+SPATIAL: SpatialIndex | None = None
+
+
+def init_locations() -> None:
+    """Nap toa do, tao BUILDER va SPATIAL (goi sau STORE.preload de hieu chinh he so duong vong)."""
+    global BUILDER, SPATIAL
+    try:
+        locations = load_locations(LOCATIONS_FILE)
+    except (OSError, ValueError, KeyError):
+        return  # khong co file toa do: source="coords" bao loi luc request
+    if DETOUR_FACTOR:
+        detour = float(DETOUR_FACTOR)
+    else:
+        mats = []
+        for f in DEFAULT_FILES.values():
+            try:
+                mat = STORE.get(BASE / f)
+            except HTTPException:
+                continue
+            mats.append((mat.ids, mat.values))
+        detour = calibrate_detour(locations, mats)
+    BUILDER = MatrixBuilder(locations, detour, cache_bytes=int(MATRIX_BUILD_CACHE_MB * 2**20))
+    SPATIAL = SpatialIndex.from_locations(locations)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # nap san cac ma tran mac dinh luc khoi dong
+    STORE.preload(BASE / f for f in DEFAULT_FILES.values())
+    init_locations()
+    start_pool()
+    try:
+        yield
+    finally:
+        stop_pool()
+
+
+# ---------- Metrics (Prometheus /metrics + header Server-Timing) ----------
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "atm_solve_stage_seconds",
+    "Thoi gian tung buoc giai mot tuyen (matrix_load, subset, matrix_build, cache_lookup, model_build, search, solve, total)",
+    ("route", "stage"),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "atm_http_request_seconds", "Thoi gian xu ly request den luc gui header", ("method", "path", "status"),
+))
+CALLBACKS = REGISTRY.register(Counter(
+    "atm_distance_callbacks_total", "So lan OR-Tools goi distance_callback", ("route",),
+))
+SOLVER_RUNS = REGISTRY.register(Counter(
+    "atm_solver_runs_total", "So lan giai theo chien luoc va trang thai ket thuc", ("strategy", "status"),
+))
+REGISTRY.register(Gauge(
+    "atm_solve_cache", "Trang thai SOLVE_CACHE",
+    lambda: [({"field": k}, v) for k, v in SOLVE_CACHE.stats().items()], ("field",),
+))
+REGISTRY.register(Gauge(
+    "atm_solver_pool", "Process pool: so worker cau hinh va so tac vu dang chay / cho",
+    lambda: [({"field": "workers"}, SOLVER_WORKERS if POOL is not None else 0), ({"field": "inflight"}, INFLIGHT)],
+    ("field",),
+))
+REGISTRY.register(Gauge(
+    "atm_jobs", "So job nen theo trang thai",
+    lambda: [({"status": st}, sum(j.status == st for j in JOBS.values()))
+             for st in ("running", "cancelling", "cancelled", "done")],
+    ("status",),
+))
+REGISTRY.register(Gauge(
+    "atm_matrices_loaded", "So ma tran CSV dang nap trong STORE", lambda: [({}, len(STORE))],
+))
+
+
+def metric_route(name: str | None) -> str:
+    """Nhan "route" cho metrics: ten tuyen mac dinh giu nguyen, ten khac (tu client) gop thanh "other"."""
+    return name if name in DEFAULT_FILES else "other"
+
+
+class TimingMiddleware:
+    """ASGI middleware: do thoi gian request, gom cac stage da do vao header Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = SERVER_TIMING.set(timings)
+        t0 = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                timings["app"] = time.perf_counter() - t0
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            SERVER_TIMING.reset(token)
+            REQUEST_SECONDS.observe(
+                timings.get("app", time.perf_counter() - t0),
+                method=scope["method"], path=route_label(scope["path"]), status=status["code"],
+            )
+
+
+def route_label(path: str) -> str:
+    """Mau duong dan cua API (vd /jobs/{job_id}) de nhan khong bung theo id; con lai la "static"."""
+    for r in app.routes:
+        if isinstance(r, APIRoute) and r.path_regex.match(path):
+            return r.path
+    return "/metrics" if path == "/metrics" else "static"
+
 
 # ---------- FastAPI app ----------
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # co the gioi han lai sau
@@ -20,6 +304,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TimingMiddleware)
 
 
 # ---------- Health check ----------
@@ -28,6 +313,18 @@ def health():
     return {"status": "ok"}
 
 
+# ---------- Thong ke cache ----------
+@app.get("/cache_stats")
+def cache_stats():
+    return SOLVE_CACHE.stats()
+
+
+# ---------- Prometheus ----------
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 # ---------- Model request/response ----------
 class SolveCSVSelectedReq(BaseModel):
     # map ten tuyen -> danh sach atm_id da chon (KHONG gom depot)
@@ -36,145 +333,815 @@ class SolveCSVSelectedReq(BaseModel):
     # co the override depot id va ten file neu muon
     depots: Dict[str, int] | None = None
     files: Dict[str, str] | None = None
+    # "csv" = ma tran tu file CSV cua tuyen; "coords" = tinh tu toa do (chon ATM bat ky, khong can files)
+    source: Literal["csv", "coords"] = "csv"
+    # thoi gian tim kiem toi da moi tuyen (giay)
+    time_limit_s: int = Field(10, gt=0)
+    # dung som khi bao nhieu giay khong cai thien (None = solver.DEFAULT_STALL_S)
+    stall_s: float | None = Field(None, ge=0)
+    # dung khi gap uoc luong <= target_gap (vd 0.05); None = chi theo thoi gian
+    target_gap: float | None = Field(None, ge=0)
+    # "auto" (chon theo so diem) | "exact" | "local" | "ortools"
+    strategy: Literal["auto", "exact", "local", "ortools"] = "auto"
 
 
 class SolveCSVSelectedResp(BaseModel):
-    # name -> {order_ids: list[int|str], total_distance_m: int}
+    # name -> {order_ids: list[int|str], total_distance_m: int, strategy: str, gap: float|None, optimal: bool}
+    # total_distance_m = do dai ca vong kin order_ids, GOM chang cuoi quay ve depot
+    # (ban dau chi cong den ATM cuoi cung, khong tinh chang ve)
     results: Dict[str, Dict[str, object]]
 
 
+class ReoptimizeReq(BaseModel):
+    # ten tuyen ("Tuyen1"...) de chon file CSV (bo qua khi source="coords")
+    route: str
+    # tour da tra ve tu /solve_csv_selected (depot o dau va cuoi)
+    order_ids: List[int]
+    insert: List[int] = []
+    remove: List[int] = []
+    files: Dict[str, str] | None = None
+    source: Literal["csv", "coords"] = "csv"
+    # thoi gian local search sau khi sua tour (mili giay)
+    time_limit_ms: int = Field(50, ge=0)
+
+
+class ReoptimizeResp(BaseModel):
+    order_ids: List[object]
+    total_distance_m: int
+    previous_distance_m: int
+    delta_m: int
+
+
 # ---------- TSP solver tu CSV ----------
-def solve_tsp_from_csv(csv_file: str | Path, start_id: int, subset_ids: List[int]) -> tuple[list[str], int]:
+def subset_from_csv(csv_file: str | Path, start_id: int, subset_ids: List[int]) -> tuple[list[str], np.ndarray, int]:
     """
-    Doc ma tran khoang cach tu CSV, cat ma tran con theo subset_ids (phai co ca start_id),
-    giai TSP (vong kin) bang OR-Tools, tra ve (route_ids, total_distance).
-    route_ids la list string (theo index CSV).
+    Lay ma tran khoang cach tu STORE (da nap san), cat ma tran con theo subset_ids (phai co ca start_id),
+    tra ve (ids, ma tran con int32, chi so cua start_id).
     """
-    csv_file = Path(csv_file)
-    if not csv_file.exists():
-        raise HTTPException(status_code=400, detail=f"CSV not found: {csv_file}")
-
-    df = pd.read_csv(csv_file, index_col=0)
-    df.index = df.index.astype(str)
+    mat = STORE.get(csv_file)
 
     want = [str(x) for x in subset_ids]
-    missing = [x for x in want if x not in df.index]
+    missing = [x for x in want if x not in mat.index]
     if missing:
         raise HTTPException(status_code=400, detail=f"IDs not in CSV index: {missing}")
 
-    df = df.loc[want, want]
-
-    ids = list(df.index)  # string
+    ids = want  # string
     if str(start_id) not in ids:
         raise HTTPException(
             status_code=400,
             detail=f"start_id {start_id} not in CSV index after subset. Current ids: {ids}",
         )
 
-    id_to_index = {id_: i for i, id_ in enumerate(ids)}
-    distance_matrix = df.values.tolist()
+    return ids, mat.subset(ids), ids.index(str(start_id))
 
-    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), 1, id_to_index[str(start_id)])
-    routing = pywrapcp.RoutingModel(manager)
 
-    def distance_callback(from_index, to_index):
-        f = manager.IndexToNode(from_index)
-        t = manager.IndexToNode(to_index)
-        return int(distance_matrix[f][t])
+def subset_from_coords(start_id: int, subset_ids: List[int]) -> tuple[list[str], np.ndarray, int]:
+    """Nhu subset_from_csv nhung ma tran tinh tu toa do (BUILDER), khong gioi han trong mot tuyen."""
+    if BUILDER is None:
+        raise HTTPException(status_code=400, detail=f"locations not loaded: {LOCATIONS_FILE}")
+    ids = [str(x) for x in subset_ids]
+    try:
+        matrix = BUILDER.build(ids)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    return ids, matrix, ids.index(str(start_id))
 
-    cb = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(cb)
 
-    search = pywrapcp.DefaultRoutingSearchParameters()
-    search.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    search.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-    search.time_limit.seconds = 10
+def route_matrix(
+    csv_path: Path | None, start_id: int, subset_ids: List[int], route: str = ""
+) -> tuple[list[str], np.ndarray, int, str]:
+    """Ma tran con cho mot tuyen: tu CSV neu co csv_path, nguoc lai tu toa do. Tra them hash phien ban ma tran."""
+    if csv_path is None:
+        with timed(STAGE_SECONDS, "matrix_build", route=route):
+            ids, matrix, start_index = subset_from_coords(start_id, subset_ids)
+        return ids, matrix, start_index, BUILDER.sha256
+    with timed(STAGE_SECONDS, "matrix_load", route=route):
+        mat = STORE.get(csv_path)
+    with timed(STAGE_SECONDS, "subset", route=route):
+        ids, matrix, start_index = subset_from_csv(csv_path, start_id, subset_ids)
+    return ids, matrix, start_index, mat.sha256
 
-    sol = routing.SolveWithParameters(search)
-    if not sol:
-        return [], 0
 
-    index = routing.Start(0)
-    route_ids: list[str] = []
-    total = 0
-    prev = None
-    while not routing.IsEnd(index):
-        node = manager.IndexToNode(index)
-        route_ids.append(ids[node])
-        if prev is not None:
-            total += routing.GetArcCostForVehicle(prev, index, 0)
-        prev = index
-        index = sol.Value(routing.NextVar(index))
+def solve_tsp_matrix(
+    ids: List[str],
+    matrix: np.ndarray,
+    start_index: int,
+    time_limit_s: int = 10,
+    stall_s: float | None = None,
+    target_gap: float | None = None,
+    strategy: str = "auto",
+    progress=None,
+    cancel=None,
+    tag: str | None = None,
+) -> tuple[list[str], int, Dict[str, object]]:
+    """
+    Giai TSP (vong kin) tren ma tran con da cat san qua solver.solve (chon chien luoc theo kich thuoc),
+    tra ve (route_ids, total_distance, info) voi info = {strategy, gap, optimal, stats};
+    stats = so do cua solver (build_s, search_s, callbacks, status), solve_route lay ra truoc khi luu cache.
+    Ham o muc module de chay duoc trong ProcessPoolExecutor.
+    progress: queue nhan (tag, route_ids, total) moi khi co tour tot hon; cancel: Event de dung som.
+    """
+    def report(order, total):
+        progress.put((tag, [ids[i] for i in order], total))
 
-    # quay ve depot
-    route_ids.append(ids[manager.IndexToNode(index)])
-    return route_ids, int(total)
+    # cancel co the la proxy cua Manager (moi lan goi la 1 lan IPC) -> chi hoi toi da 10 lan/giay
+    last = {"at": 0.0, "set": False}
 
+    def poll_cancel():
+        now = time.monotonic()
+        if not last["set"] and now - last["at"] >= 0.1:
+            last["at"] = now
+            last["set"] = cancel.is_set()
+        return last["set"]
 
-# ---------- Endpoint giai 3 tuyen tu CSV ----------
-@app.post("/solve_csv_selected", response_model=SolveCSVSelectedResp)
-def solve_csv_selected(req: SolveCSVSelectedReq):
+    if progress is not None:
+        on_improve = report
+    else:
+        on_improve = None
+    if cancel is not None:
+        should_cancel = poll_cancel
+    else:
+        should_cancel = None
+
+    tour = solver.solve(
+        matrix, start_index, time_limit_s, stall_s, target_gap, strategy,
+        on_improve=on_improve, should_cancel=should_cancel,
+    )
+    info = {"strategy": tour.strategy, "gap": tour.gap, "optimal": tour.optimal, "stats": tour.stats}
+    return [ids[i] for i in tour.order], tour.total, info
+
+
+def solve_tsp_from_csv(csv_file: str | Path, start_id: int, subset_ids: List[int]) -> tuple[list[str], int]:
     """
-    Nhan cac diem da chon theo tung tuyen, cat ma tran CSV theo tap con (them depot),
-    giai TSP tung tuyen doc lap, tra ket qua.
+    Cat ma tran con tu CSV roi giai TSP, tra ve (route_ids, total_distance).
+    route_ids la list string (theo index CSV).
     """
-    # Folder cha: .../AppBIDV (app.py nam trong .../AppBIDV/atm-backend/)
-    BASE = Path(__file__).resolve().parents[1]
+    ids, matrix, start_index = subset_from_csv(csv_file, start_id, subset_ids)
+    route_ids, total, _info = solve_tsp_matrix(ids, matrix, start_index)
+    return route_ids, total
 
-    default_files = {
-        "Tuyen1": "Distance_Matrix_Tuyến1.csv",
-        "Tuyen2": "Distance_Matrix_Tuyến2.csv",
-        "Tuyen3": "Distance_Matrix_Tuyến3.csv",
-    }
-    default_depots = {
-        "Tuyen1": 1,
-        "Tuyen2": 2,
-        "Tuyen3": 3,
-    }
+
+def to_order_ids(route_ids_str: List[str]) -> list[object]:
+    # convert ra int neu duoc
+    order_ids: list[object] = []
+    for s in route_ids_str:
+        try:
+            order_ids.append(int(s))
+        except ValueError:
+            order_ids.append(s)
+    return order_ids
+
+
+def route_jobs(req: SolveCSVSelectedReq) -> Dict[str, tuple[Path | None, int, List[int]]]:
+    """Tach request thanh tung tuyen: name -> (csv_path, depot_id, subset); csv_path = None khi source="coords"."""
+    default_files = DEFAULT_FILES
+    default_depots = DEFAULT_DEPOTS
 
     files = req.files or default_files
     depots = req.depots or default_depots
 
-    results: Dict[str, Dict[str, object]] = {}
-
+    jobs: Dict[str, tuple[Path | None, int, List[int]]] = {}
     for name, picked in req.routes.items():
         if not picked:
             continue
 
         csv_name = files.get(name, default_files.get(name))
-        if not csv_name:
+        if not csv_name and req.source == "csv":
             continue
 
         depot_id = depots.get(name, default_depots.get(name))
         if depot_id is None:
             continue
 
-        csv_path = BASE / csv_name
+        csv_path = BASE / csv_name if req.source == "csv" else None
 
         # tap con: [depot] + cac ATM da chon (unique, giu thu tu)
         subset = [depot_id] + list(dict.fromkeys(picked))
+        jobs[name] = (csv_path, depot_id, subset)
+    return jobs
+
+
+# ---------- Cache ket qua giai ----------
+class SolutionCache:
+    """
+    LRU cache ket qua TSP, key = (hash ma tran, depot, tap ATM khong thu tu, strategy yeu cau).
+    Co TTL, tang dia tuy chon (1 file JSON / key) de giu qua lan khoi dong lai; tang dia giu toi da
+    max_disk_files file (xoa file dung lau nhat theo mtime), file het han bi xoa khi doc hoac khi don.
+    Moi ket qua luu kem dieu kien dung da dung (time_limit_s, stall_s, target_gap) va status cua solver;
+    chi dung lai cho request co dieu kien dung khong chat hon (xem covers), hoac neu da toi uu.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_s: float = 86400.0,
+        disk_dir: str | Path | None = None,
+        max_disk_files: int = 10000,
+    ):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_files = max_disk_files
+        self._items: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        # so file tren dia; None = chua dem (lan ghi dau tien se don ca thu muc)
+        self._disk_files: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(matrix_sha: str, depot_id: int, subset: List[int], strategy: str) -> tuple:
+        atms = sorted({str(x) for x in subset} - {str(depot_id)})
+        return (matrix_sha, str(depot_id), tuple(atms), strategy)
 
-        route_ids_str, total = solve_tsp_from_csv(csv_path, depot_id, subset_ids=subset)
+    @staticmethod
+    def covers(entry: dict, time_limit_s: int, stall_s: float, target_gap: float | None) -> bool:
+        """
+        Ket qua trong entry co tot bang lan giai moi voi (time_limit_s, stall_s, target_gap) khong:
+        giai lau hon, chiu stall lau hon va target_gap khong long hon (None = khong dung theo gap).
+        Ket qua dung som vi TARGET_GAP / stall ngan khong duoc tinh la da chay het time_limit_s.
+        """
+        if entry.get("optimal"):
+            return True
+        if entry["time_limit_s"] < time_limit_s or entry.get("stall_s", 0.0) < stall_s:
+            return False
+        done_gap = entry.get("target_gap")
+        return done_gap is None or (target_gap is not None and done_gap <= target_gap)
 
-        # convert ra int neu duoc
-        order_ids: list[object] = []
-        for s in route_ids_str:
+    def _disk_path(self, key: tuple) -> Path:
+        name = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return self.disk_dir / f"{name}.json"
+
+    def _fresh(self, entry: dict) -> bool:
+        return self.ttl_s <= 0 or time.time() - entry["created"] <= self.ttl_s
+
+    def get(self, key: tuple, time_limit_s: int, stall_s: float, target_gap: float | None) -> dict | None:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and not self._fresh(entry):
+                del self._items[key]
+                self._remove_disk(key)
+                entry = None
+            if entry is None:
+                entry = self._read_disk(key)
+                if entry is not None:
+                    self._insert(key, entry)
+            if entry is None or not self.covers(entry, time_limit_s, stall_s, target_gap):
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self,
+        key: tuple,
+        route_ids: List[str],
+        total: int,
+        time_limit_s: int,
+        stall_s: float,
+        target_gap: float | None,
+        status: str,
+        info: Dict[str, object] | None = None,
+    ) -> None:
+        entry = {
+            "route_ids": list(route_ids),
+            "total": int(total),
+            "time_limit_s": time_limit_s,
+            "stall_s": stall_s,
+            "target_gap": target_gap,
+            "status": status,
+            "created": time.time(),
+            **(info or {}),
+        }
+        with self._lock:
+            old = self._items.get(key)
+            if old is not None and self._fresh(old):
+                # route tot hon dat duoc ca hai dieu kien dung -> gop dieu kien, giu route tot hon
+                gaps = [old.get("target_gap"), target_gap]
+                budget = {
+                    "time_limit_s": max(old["time_limit_s"], time_limit_s),
+                    "stall_s": max(old.get("stall_s", 0.0), stall_s),
+                    "target_gap": None if None in gaps else min(gaps),
+                }
+                entry = {**(old if old["total"] <= entry["total"] else entry), **budget}
+            self._insert(key, entry)
+        self._write_disk(key, entry)
+
+    def _insert(self, key: tuple, entry: dict) -> None:
+        self._items[key] = entry
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _read_disk(self, key: tuple) -> dict | None:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not self._fresh(entry):
+            self._remove_disk(key)
+            return None
+        try:
+            os.utime(path)  # mtime = lan dung gan nhat, de _prune_disk xoa theo LRU
+        except OSError:
+            pass
+        return entry
+
+    def _remove_disk(self, key: tuple) -> None:
+        if self.disk_dir is None:
+            return
+        try:
+            self._disk_path(key).unlink()
+        except OSError:
+            return
+        if self._disk_files is not None:
+            self._disk_files -= 1
+
+    def _write_disk(self, key: tuple, entry: dict) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            is_new = not path.exists()
+            path.write_text(json.dumps(entry), encoding="utf-8")
+        except OSError:
+            return  # cache chi la toi uu, khong bat buoc
+        with self._lock:
+            if self._disk_files is None or (is_new and self._disk_files + 1 > self.max_disk_files):
+                self._prune_disk()
+            elif is_new:
+                self._disk_files += 1
+
+    def _prune_disk(self) -> None:
+        """Xoa file het han (theo mtime) roi file dung lau nhat cho toi khi con 90% max_disk_files."""
+        try:
+            files = [(p.stat().st_mtime, p) for p in self.disk_dir.glob("*.json")]
+        except OSError:
+            return
+        files.sort()
+        now = time.time()
+        # created <= mtime, nen mtime qua TTL thi chac chan entry da het han
+        expired = sum(1 for mtime, _ in files if self.ttl_s > 0 and now - mtime > self.ttl_s)
+        keep = len(files) - expired
+        if keep > self.max_disk_files:
+            keep = self.max_disk_files * 9 // 10
+        # files sap xep theo mtime tang dan: file het han va file dung lau nhat nam dau danh sach
+        for _, p in files[:len(files) - keep]:
             try:
-                order_ids.append(int(s))
-            except ValueError:
-                order_ids.append(s)
+                p.unlink()
+            except OSError:
+                pass
+        self._disk_files = keep
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
 
-        results[name] = {
-            "order_ids": order_ids,
-            "total_distance_m": total,
+SOLVE_CACHE = SolutionCache(
+    max_size=int(os.getenv("SOLVE_CACHE_SIZE", "1024")),
+    ttl_s=float(os.getenv("SOLVE_CACHE_TTL", "86400")),
+    # "" = chi cache trong RAM
+    disk_dir=os.getenv("SOLVE_CACHE_DIR", str(Path(__file__).resolve().parent / ".solve_cache")) or None,
+    max_disk_files=int(os.getenv("SOLVE_CACHE_DISK_FILES", "10000")),
+)
+
+
+# ---------- Pool giai song song ----------
+# so process giai dong thoi; 0 = giai tuan tu trong thread (khong tao process)
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+POOL: ProcessPoolExecutor | None = None
+# so tac vu dang o trong pool (dang chay + dang cho), cho gauge atm_solver_pool
+INFLIGHT = 0
+# Manager cap Queue/Event dung chung giua process cha va worker (cho job stream)
+MANAGER = None
+
+
+def start_pool() -> None:
+    global POOL, MANAGER
+    if SOLVER_WORKERS > 0 and POOL is None:
+        # "spawn" thay vi fork mac dinh: process cha (uvicorn) da co nhieu thread + lock (STORE, SOLVE_CACHE),
+        # fork luc mot thread dang giu lock thi worker co the treo vinh vien
+        ctx = multiprocessing.get_context("spawn")
+        POOL = ProcessPoolExecutor(max_workers=SOLVER_WORKERS, mp_context=ctx)
+        MANAGER = ctx.Manager()
+
+
+def stop_pool() -> None:
+    global POOL, MANAGER
+    if POOL is not None:
+        POOL.shutdown(wait=False, cancel_futures=True)
+        POOL = None
+    if MANAGER is not None:
+        MANAGER.shutdown()
+        MANAGER = None
+
+
+def new_channel() -> tuple[object, object]:
+    """(queue, event) truyen duoc vao worker: cua Manager neu co pool, nguoc lai ban thuong cho thread."""
+    if MANAGER is not None:
+        return MANAGER.Queue(), MANAGER.Event()
+    return queue.Queue(), threading.Event()
+
+
+async def run_solver(fn, *args):
+    """Chay fn(*args) trong process pool (neu co), nguoc lai trong thread mac dinh."""
+    global INFLIGHT
+    loop = asyncio.get_running_loop()
+    INFLIGHT += 1
+    try:
+        return await loop.run_in_executor(POOL, fn, *args)
+    finally:
+        INFLIGHT -= 1
+
+
+async def solve_route(
+    csv_path: Path | None,
+    depot_id: int,
+    subset: List[int],
+    time_limit_s: int = 10,
+    stall_s: float | None = None,
+    target_gap: float | None = None,
+    strategy: str = "auto",
+    progress=None,
+    cancel=None,
+    tag: str | None = None,
+) -> Dict[str, object]:
+    """
+    Giai mot tuyen (co cache); loi cua tuyen nao chi bao trong ket qua cua tuyen do.
+    progress / cancel / tag: xem solve_tsp_matrix. Ket qua bi huy giua chung khong luu cache.
+    Thoi gian tung buoc ghi vao STAGE_SECONDS (nhan route = metric_route(tag)).
+    """
+    route = metric_route(tag)
+    stall = solver.DEFAULT_STALL_S if stall_s is None else stall_s
+    t0 = time.perf_counter()
+    try:
+        # doc CSV / tinh ma tran tu toa do co the mat vai giay voi N lon: chay ngoai event loop
+        ids, matrix, start_index, matrix_sha = await asyncio.to_thread(route_matrix, csv_path, depot_id, subset, route)
+        key = SOLVE_CACHE.key(matrix_sha, depot_id, subset, strategy)
+        with timed(STAGE_SECONDS, "cache_lookup", route=route):
+            hit = SOLVE_CACHE.get(key, time_limit_s, stall, target_gap)
+        if hit is not None:
+            observe_stage(STAGE_SECONDS, "total", time.perf_counter() - t0, route=route)
+            return {
+                "order_ids": to_order_ids(hit["route_ids"]),
+                "total_distance_m": hit["total"],
+                "strategy": hit.get("strategy"),
+                "gap": hit.get("gap"),
+                "optimal": hit.get("optimal", False),
+                "cached": True,
+            }
+        with timed(STAGE_SECONDS, "solve", route=route):
+            route_ids_str, total, info = await run_solver(
+                solve_tsp_matrix, ids, matrix, start_index, time_limit_s, stall_s, target_gap, strategy,
+                progress, cancel, tag,
+            )
+        stats = info.pop("stats")
+        record_solver_stats(route, info["strategy"], stats)
+        cancelled = cancel is not None and cancel.is_set()
+        if route_ids_str and not cancelled:
+            SOLVE_CACHE.put(key, route_ids_str, total, time_limit_s, stall, target_gap, stats.get("status", ""), info)
+    except HTTPException as e:
+        return {"order_ids": [], "total_distance_m": 0, "error": e.detail}
+    except Exception as e:  # vd: BrokenProcessPool, loi OR-Tools, strategy sai
+        return {"order_ids": [], "total_distance_m": 0, "error": f"{type(e).__name__}: {e}"}
+
+    observe_stage(STAGE_SECONDS, "total", time.perf_counter() - t0, route=route)
+    return {
+        "order_ids": to_order_ids(route_ids_str),
+        "total_distance_m": total,
+        **info,
+        "cached": False,
+    }
+
+
+def record_solver_stats(route: str, strategy: str, stats: Dict[str, object]) -> None:
+    """Ghi so do tu worker (model_build, search, so callback, status) vao metrics."""
+    if "build_s" in stats:
+        observe_stage(STAGE_SECONDS, "model_build", stats["build_s"], route=route)
+    if "search_s" in stats:
+        observe_stage(STAGE_SECONDS, "search", stats["search_s"], route=route)
+    if stats.get("callbacks"):
+        CALLBACKS.inc(stats["callbacks"], route=route)
+    SOLVER_RUNS.inc(strategy=strategy, status=stats.get("status", ""))
+
+
+# ---------- Endpoint giai 3 tuyen tu CSV ----------
+@app.post("/solve_csv_selected", response_model=SolveCSVSelectedResp)
+async def solve_csv_selected(req: SolveCSVSelectedReq):
+    """
+    Nhan cac diem da chon theo tung tuyen, cat ma tran CSV theo tap con (them depot),
+    giai TSP cac tuyen song song (process pool), tra ket qua.
+    Tuyen nao loi thi results[name] co them truong "error"; "cached" = lay tu SOLVE_CACHE.
+    "total_distance_m" tinh ca chang quay ve depot (khop voi order_ids bat dau va ket thuc tai depot).
+    "strategy" = thuat toan da dung, "gap" = gap toi uu (0 neu chung minh duoc, con lai la uoc luong).
+    """
+    return SolveCSVSelectedResp(results=await solve_request(req))
+
+
+async def solve_request(req: SolveCSVSelectedReq) -> Dict[str, Dict[str, object]]:
+    """Giai tat ca cac tuyen cua mot request song song, tra ve name -> ket qua tuyen."""
+    jobs = route_jobs(req)
+    budget = (req.time_limit_s, req.stall_s, req.target_gap, req.strategy)
+    outs = await asyncio.gather(*(solve_route(*job, *budget, tag=name) for name, job in jobs.items()))
+    return dict(zip(jobs.keys(), outs))
+
+
+# ---------- Giai nhieu kich ban (what-if) ----------
+# so kich ban dang giai cung luc; gioi han nay giu bo nho on dinh du batch dai bao nhieu
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", str(max(1, SOLVER_WORKERS) * 2)))
+
+
+class BatchScenario(SolveCSVSelectedReq):
+    # id tuy chon de doi chieu ket qua (mac dinh: so thu tu dong, tinh tu 0)
+    id: str | int | None = None
+
+
+@app.post("/solve_batch")
+async def solve_batch(request: Request):
+    """
+    Body NDJSON: moi dong la mot kich ban cung dang /solve_csv_selected (them "id" tuy chon).
+    Tra ve NDJSON, moi dong {"index", "id", "results"} (hoac "error") ngay khi kich ban do xong,
+    nen thu tu dong ra co the khac thu tu dong vao. Cac kich ban dung chung STORE, SOLVE_CACHE va POOL.
+    Body duoc doc het truoc khi stream (StreamingResponse tu nghe receive() de bat ngat ket noi),
+    nhung chi toi da BATCH_WINDOW kich ban duoc cat ma tran / giai cung luc.
+    """
+    lines = [line for line in (await request.body()).splitlines() if line.strip()]
+
+    async def one(index: int, line: bytes) -> Dict[str, object]:
+        try:
+            sc = BatchScenario.model_validate_json(line)
+        except ValidationError as e:
+            return {"index": index, "id": index, "error": f"invalid scenario: {e}"}
+        scenario_id = index if sc.id is None else sc.id
+        return {"index": index, "id": scenario_id, "results": await solve_request(sc)}
+
+    async def stream():
+        pending: set[asyncio.Task] = set()
+        index = 0
+        try:
+            for line in lines:
+                if len(pending) >= BATCH_WINDOW:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        yield json.dumps(t.result()) + "\n"
+                pending.add(asyncio.create_task(one(index, line)))
+                index += 1
+            for t in asyncio.as_completed(pending):
+                yield json.dumps(await t) + "\n"
+        finally:
+            for t in pending:
+                t.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# ---------- Sua tour dang co (them / bot ATM) ----------
+@app.post("/reoptimize", response_model=ReoptimizeResp)
+def reoptimize(req: ReoptimizeReq):
+    """
+    Bo cac ATM trong remove, chen cac ATM trong insert vao vi tri re nhat cua tour order_ids,
+    chay 2-opt/Or-opt trong time_limit_ms, tra ve tour moi va do chenh quang duong.
+    """
+    if len(req.order_ids) < 2 or req.order_ids[0] != req.order_ids[-1]:
+        raise HTTPException(status_code=400, detail="order_ids must be a closed tour starting and ending at the depot")
+    depot_id = req.order_ids[0]
+    if depot_id in req.order_ids[1:-1]:
+        raise HTTPException(status_code=400, detail=f"depot {depot_id} may only appear at the start and end of order_ids")
+    if depot_id in req.remove:
+        raise HTTPException(status_code=400, detail=f"cannot remove depot {depot_id}")
+
+    csv_path = None
+    if req.source == "csv":
+        csv_name = (req.files or {}).get(req.route, DEFAULT_FILES.get(req.route))
+        if not csv_name:
+            raise HTTPException(status_code=400, detail=f"unknown route: {req.route}")
+        csv_path = BASE / csv_name
+
+    # ma tran con gom tour cu + diem moi; chi so trong tour = vi tri trong subset
+    stops = list(dict.fromkeys(req.order_ids[1:-1]))
+    added = [x for x in dict.fromkeys(req.insert) if x not in stops and x != depot_id]
+    subset = [depot_id] + stops + added
+    ids, matrix, start_index, _sha = route_matrix(csv_path, depot_id, subset, metric_route(req.route))
+    pos = {x: i for i, x in enumerate(subset)}
+
+    old_order = [start_index] + [pos[x] for x in stops] + [start_index]
+    new_order = solver.reoptimize(
+        matrix,
+        old_order,
+        [pos[x] for x in added],
+        [pos[x] for x in req.remove if x in pos],
+        req.time_limit_ms / 1000,
+    )
+    old_total = solver.tour_length(matrix, old_order)
+    new_total = solver.tour_length(matrix, new_order)
+    return ReoptimizeResp(
+        order_ids=to_order_ids([ids[i] for i in new_order]),
+        total_distance_m=new_total,
+        previous_distance_m=old_total,
+        delta_m=new_total - old_total,
+    )
+
+
+# ---------- Tra cuu ATM theo vi tri ----------
+def query_point(lat: float | None, lon: float | None, atm_id: int | None) -> tuple[float, float, int | None]:
+    """Diem truy van (radian) tu lat/lon (do) hoac tu toa do cua atm_id; tra them row cua atm_id."""
+    if SPATIAL is None:
+        raise HTTPException(status_code=400, detail=f"locations not loaded: {LOCATIONS_FILE}")
+    if atm_id is not None:
+        row = SPATIAL.index.get(str(atm_id))
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"ATM without coordinates: {atm_id}")
+        return float(SPATIAL.lat[row]), float(SPATIAL.lon[row]), row
+    if lat is None or lon is None:
+        raise HTTPException(status_code=400, detail="give either atm_id or both lat and lon")
+    return math.radians(lat), math.radians(lon), None
+
+
+def spatial_results(found: List[tuple[int, float]]) -> Dict[str, object]:
+    return {
+        "results": [
+            {
+                "atm_id": to_order_ids([SPATIAL.ids[row]])[0],
+                "distance_m": round(dist, 1),
+                "lat": math.degrees(SPATIAL.lat[row]),
+                "lon": math.degrees(SPATIAL.lon[row]),
+            }
+            for row, dist in found
+        ]
+    }
+
+
+@app.get("/atms/nearest")
+def atms_nearest(k: int = 5, lat: float | None = None, lon: float | None = None, atm_id: int | None = None):
+    """k ATM gan nhat (duong chim bay) quanh lat/lon hoac quanh atm_id (khong tinh chinh no)."""
+    qlat, qlon, row = query_point(lat, lon, atm_id)
+    return spatial_results(SPATIAL.nearest(qlat, qlon, k, exclude=row))
+
+
+@app.get("/atms/within")
+def atms_within(radius_m: float, lat: float | None = None, lon: float | None = None, atm_id: int | None = None):
+    """Cac ATM trong ban kinh radius_m quanh lat/lon hoac quanh atm_id (vd: depot)."""
+    qlat, qlon, row = query_point(lat, lon, atm_id)
+    found = [(r, dist) for r, dist in SPATIAL.within(qlat, qlon, radius_m) if r != row]
+    return spatial_results(found)
+
+
+# ---------- Job giai bat dong bo (stream loi giai tam thoi, huy duoc) ----------
+# giu job da xong bao lau (giay) truoc khi xoa khoi JOBS
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "3600"))
+# chu ky (giay) doc queue progress khi queue rong
+PROGRESS_POLL_S = 0.1
+
+
+class SolveJob:
+    """
+    Mot lan giai /solve_csv_selected chay nen. Moi su kien (incumbent / result / end) duoc luu
+    trong events de client ket noi muon van doc lai tu dau.
+    """
+
+    def __init__(self, req: SolveCSVSelectedReq):
+        self.id = uuid.uuid4().hex
+        self.req = req
+        self.status = "running"  # running | cancelling | cancelled | done
+        self.created = time.time()
+        self.finished: float | None = None
+        self.incumbents: Dict[str, Dict[str, object]] = {}
+        self.results: Dict[str, Dict[str, object]] = {}
+        self.events: List[tuple[str, Dict[str, object]]] = []
+        self.changed = asyncio.Condition()
+        self.progress, self.cancel = new_channel()
+        self.task: asyncio.Task | None = None
+
+    async def publish(self, event: str, data: Dict[str, object]) -> None:
+        async with self.changed:
+            self.events.append((event, data))
+            self.changed.notify_all()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "incumbents": self.incumbents,
+            "results": self.results,
         }
 
-    return SolveCSVSelectedResp(results=results)
+
+JOBS: Dict[str, SolveJob] = {}
+
+
+def purge_jobs() -> None:
+    now = time.time()
+    for job_id in [k for k, j in JOBS.items() if j.finished is not None and now - j.finished > JOB_TTL_S]:
+        del JOBS[job_id]
+
+
+async def pump_progress(job: SolveJob) -> None:
+    """
+    Doc queue progress tu worker, phat su kien "incumbent" cho tuyen chua co ket qua cuoi.
+    Doc khong chan (get_nowait + sleep) thay vi get(timeout) trong thread: khong giu thread nao cua
+    executor mac dinh, noi run_solver giai khi SOLVER_WORKERS=0.
+    """
+    while True:
+        try:
+            item = job.progress.get_nowait()
+        except queue.Empty:
+            await asyncio.sleep(PROGRESS_POLL_S)
+            continue
+        if item is None:
+            return
+        name, route_ids_str, total = item
+        if name in job.results:
+            continue
+        out = {"route": name, "order_ids": to_order_ids(route_ids_str), "total_distance_m": total}
+        job.incumbents[name] = out
+        await job.publish("incumbent", out)
+
+
+async def run_job(job: SolveJob) -> None:
+    req = job.req
+    budget = (req.time_limit_s, req.stall_s, req.target_gap, req.strategy)
+
+    async def one(name: str, route_job: tuple[Path | None, int, List[int]]) -> None:
+        out = await solve_route(*route_job, *budget, job.progress, job.cancel, name)
+        job.results[name] = out
+        await job.publish("result", {"route": name, **out})
+
+    pump = asyncio.create_task(pump_progress(job))
+    try:
+        await asyncio.gather(*(one(name, rj) for name, rj in route_jobs(req).items()))
+    finally:
+        job.progress.put(None)
+        await pump
+        job.status = "cancelled" if job.cancel.is_set() else "done"
+        job.finished = time.time()
+        await job.publish("end", {"status": job.status, "results": job.results})
+
+
+def get_job(job_id: str) -> SolveJob:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job not found: {job_id}")
+    return job
+
+
+@app.post("/jobs")
+async def create_job(req: SolveCSVSelectedReq):
+    """Tao job giai cac tuyen, tra ve job_id ngay; theo doi qua GET /jobs/{id}/events (SSE)."""
+    purge_jobs()
+    job = SolveJob(req)
+    JOBS[job.id] = job
+    job.task = asyncio.create_task(run_job(job))
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job(job_id).snapshot()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events: "incumbent" moi khi mot tuyen co tour tot hon, "result" khi tuyen xong,
+    "end" khi ca job xong hoac bi huy. Ket noi muon se nhan lai cac su kien da qua.
+    """
+    job = get_job(job_id)
+
+    async def stream():
+        sent = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.events) > sent)
+                batch = job.events[sent:]
+            sent += len(batch)
+            for event, data in batch:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == "end":
+                    return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Huy job: cac tuyen dang giai dung som va tra tour tot nhat hien co, tra lai worker cho pool."""
+    job = get_job(job_id)
+    if job.finished is None:
+        job.cancel.set()
+        job.status = "cancelling"
+    return job.snapshot()
 
 
 # ---------- Mount React build (STATIC) ----------
 # LUU Y: dong nay DAT CUOI CUNG, sau tat ca cac @app.get/@app.post
-app.mount("/", StaticFiles(directory="webui", html=True), name="ui")
+app.mount("/", StaticFiles(directory=Path(__file__).resolve().parent / "webui", html=True), name="ui")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+# matrix_builder.py - Tao ma tran khoang cach tu toa do ATM (ATM_Location_Last.jsonl)
+#
+# Khoang cach = haversine (m) * he so duong vong (detour), he so nay hieu chinh tu cac CSV
+# khoang cach duong bo co san. Ma tran lon duoc tinh theo khoi dong de gioi han bo nho tam.
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+# cap diem gan hon muc nay bi bo qua khi hieu chinh (sai so geocode lon hon khoang cach)
+CALIBRATION_MIN_M = 200.0
+
+
+@dataclass
+class Locations:
+    ids: List[str]
+    index: Dict[str, int]
+    lat: np.ndarray     # radian, float64
+    lon: np.ndarray     # radian, float64
+    sha256: str         # hash noi dung file nguon
+
+    def rows(self, want: List[str]) -> np.ndarray:
+        missing = [x for x in want if x not in self.index]
+        if missing:
+            raise KeyError(f"IDs without coordinates: {missing}")
+        return np.fromiter((self.index[x] for x in want), dtype=np.intp, count=len(want))
+
+
+def load_locations(path: str | Path) -> Locations:
+    """Doc file JSONL (moi dong co atm_id, lat, lon); id trung thi giu dong dau tien."""
+    raw = Path(path).read_bytes()
+    ids: List[str] = []
+    lat: List[float] = []
+    lon: List[float] = []
+    seen = set()
+    for line in raw.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if row.get("lat") is None or row.get("lon") is None:
+            continue
+        atm_id = str(row["atm_id"])
+        if atm_id in seen:
+            continue
+        seen.add(atm_id)
+        ids.append(atm_id)
+        lat.append(float(row["lat"]))
+        lon.append(float(row["lon"]))
+    return Locations(
+        ids,
+        {x: i for i, x in enumerate(ids)},
+        np.radians(np.asarray(lat, dtype=np.float64)),
+        np.radians(np.asarray(lon, dtype=np.float64)),
+        hashlib.sha256(raw).hexdigest(),
+    )
+
+
+def haversine(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Khoang cach (m) giua moi cap (lat1[i], lon1[i]) x (lat2[j], lon2[j]), dau vao la radian."""
+    dlat = lat2[None, :] - lat1[:, None]
+    dlon = lon2[None, :] - lon1[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1)[:, None] * np.cos(lat2)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def calibrate_detour(locations: Locations, matrices: Iterable[tuple[List[str], np.ndarray]]) -> float:
+    """
+    He so duong vong = trung vi cua (khoang cach duong bo / haversine) tren cac ma tran co san.
+    matrices: cac cap (ids, values N x N). Tra ve 1.0 neu khong co du lieu.
+    """
+    ratios = []
+    for ids, values in matrices:
+        keep = [i for i, x in enumerate(ids) if x in locations.index]
+        if len(keep) < 2:
+            continue
+        rows = locations.rows([ids[i] for i in keep])
+        road = np.asarray(values)[np.ix_(keep, keep)].astype(np.float64)
+        h = haversine(locations.lat[rows], locations.lon[rows], locations.lat[rows], locations.lon[rows])
+        mask = h > CALIBRATION_MIN_M
+        ratios.append(road[mask] / h[mask])
+    if not ratios:
+        return 1.0
+    return float(np.median(np.concatenate(ratios)))
+
+
+class MatrixBuilder:
+    """
+    Tao ma tran int32 (m) cho tap id bat ky tu toa do, tinh theo khoi block_rows dong.
+    Ket qua duoc nho (LRU theo tap id khong thu tu), tong dung luong toi da cache_bytes;
+    ma tran lon hon cache_bytes thi khong nho.
+    """
+
+    def __init__(
+        self, locations: Locations, detour: float = 1.0, block_rows: int = 1024, cache_bytes: int = 256 * 2**20
+    ):
+        self.locations = locations
+        self.detour = detour
+        self.block_rows = block_rows
+        self.cache_bytes = cache_bytes
+        self._items: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        # hash phien ban ma tran: doi khi doi file toa do hoac he so
+        self.sha256 = hashlib.sha256(f"{locations.sha256}:{detour!r}".encode("utf-8")).hexdigest()
+
+    def fill(self, rows: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """Ghi ma tran cho cac dong rows (chi so trong locations) vao out (co the la np.memmap)."""
+        lat, lon = self.locations.lat[rows], self.locations.lon[rows]
+        for s in range(0, len(rows), self.block_rows):
+            e = min(s + self.block_rows, len(rows))
+            block = haversine(lat[s:e], lon[s:e], lat, lon)
+            block *= self.detour
+            out[s:e] = block.astype(np.int32)  # cat phan thap phan nhu ma tran CSV
+        return out
+
+    def build(self, want: List[str]) -> np.ndarray:
+        """Ma tran (len(want) x len(want)) theo dung thu tu want."""
+        key = tuple(sorted(set(want)))
+        with self._lock:
+            values = self._items.get(key)
+            if values is not None:
+                self._items.move_to_end(key)
+        if values is None:
+            rows = self.locations.rows(list(key))
+            values = self.fill(rows, np.empty((len(key), len(key)), dtype=np.int32))
+            if values.nbytes <= self.cache_bytes:
+                with self._lock:
+                    if key not in self._items:
+                        self._items[key] = values
+                        self._nbytes += values.nbytes
+                    while self._nbytes > self.cache_bytes:
+                        _, old = self._items.popitem(last=False)
+                        self._nbytes -= old.nbytes
+        pos = {x: i for i, x in enumerate(key)}
+        idx = np.fromiter((pos[x] for x in want), dtype=np.intp, count=len(want))
+        return values[np.ix_(idx, idx)]
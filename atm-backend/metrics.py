@@ -0,0 +1,149 @@
+# metrics.py - Do thoi gian tung buoc giai + xuat dinh dang Prometheus (text 0.0.4), khong can prometheus_client
+#
+# Moi metric giu gia tri theo bo nhan (labels). Thoi gian do trong request hien tai con duoc cong
+# vao SERVER_TIMING de middleware ghi header Server-Timing.
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# stage -> tong so giay trong request hien tai (None = khong trong request HTTP)
+SERVER_TIMING: ContextVar[Dict[str, float] | None] = ContextVar("server_timing", default=None)
+
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gia tri doc luc scrape: fn() tra ve [(dict nhan, gia tri)]."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Iterable[tuple[Dict[str, object], float]]], labels=()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_fmt_labels(self.labels, self._key(lbl))} {v}" for lbl, v in self.fn()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [dem theo bucket..., dem +Inf], tong
+        self._values: Dict[tuple, tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t)) for k, (c, t) in self._values.items())
+        out = self.header()
+        for key, (counts, total) in items:
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(self.name + "_bucket" + _fmt_labels(self.labels, key, 'le="%s"' % le) + f" {acc}")
+            acc += counts[-1]
+            out.append(self.name + "_bucket" + _fmt_labels(self.labels, key, 'le="+Inf"') + f" {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {total}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+def add_server_timing(stage: str, seconds: float) -> None:
+    timings = SERVER_TIMING.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_stage(hist: Histogram, stage: str, seconds: float, **labels) -> None:
+    hist.observe(seconds, stage=stage, **labels)
+    add_server_timing(stage, seconds)
+
+
+@contextmanager
+def timed(hist: Histogram, stage: str, **labels):
+    """with timed(STAGE_SECONDS, "subset", route=name): ... -> ghi histogram + Server-Timing."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(hist, stage, time.perf_counter() - t0, **labels)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={sec * 1000:.1f}" for stage, sec in timings.items())
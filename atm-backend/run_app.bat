@@ -25,7 +25,7 @@ if not exist "%PYTHON%" (
 
   echo [*] Cai thu vien lan dau...
   call "%VENV%\Scripts\pip.exe" install --upgrade pip
-  call "%VENV%\Scripts\pip.exe" install fastapi uvicorn ortools requests pydantic
+  call "%VENV%\Scripts\pip.exe" install fastapi uvicorn ortools requests pydantic numpy pandas
 )
 
 REM --- Start backend trong cua so rieng (co log day du) ---
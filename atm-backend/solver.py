@@ -0,0 +1,532 @@
+# solver.py - Lop giai TSP chon chien luoc theo kich thuoc bai toan
+#
+#   n <= EXACT_MAX_N  : Held-Karp (DP bitmask), ket qua toi uu (gap = 0)
+#   n <= LOCAL_MAX_N  : 2-opt / Or-opt vector hoa bang NumPy + kick double-bridge
+#   con lai           : OR-Tools GLS, dung som khi khong cai thien sau stall_s giay
+#
+# Ma tran co the bat doi xung (d[i][j] != d[j][i]), moi phep tinh deu theo chieu di.
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+import os
+import time
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+EXACT_MAX_N = int(os.getenv("SOLVER_EXACT_MAX_N", "15"))
+LOCAL_MAX_N = int(os.getenv("SOLVER_LOCAL_MAX_N", "60"))
+# so giay khong cai thien thi dung (local search va OR-Tools)
+DEFAULT_STALL_S = float(os.getenv("SOLVER_STALL_S", "2"))
+# Held-Karp ton O(2^n * n) bo nho: khong cho ep "exact" qua muc nay
+EXACT_HARD_MAX_N = 20
+# thoi gian toi da (giay) cho can duoi 1-tree, ngoai ra khong qua 10% time_limit_s
+BOUND_BUDGET_S = float(os.getenv("SOLVER_BOUND_BUDGET_S", "1"))
+
+STRATEGIES = ("auto", "exact", "local", "ortools")
+
+# on_improve(order, total): goi moi khi tim duoc tour tot hon (loi giai tam thoi)
+# should_cancel(): tra True thi dung ngay, tra ve tour tot nhat hien co
+OnImprove = Callable[[List[int], int], None]
+ShouldCancel = Callable[[], bool]
+
+
+@dataclass
+class Tour:
+    order: List[int]        # chi so node, bat dau va ket thuc tai start
+    total: int
+    strategy: str           # "exact" | "local" | "ortools"
+    gap: float | None       # 0.0 neu toi uu; nguoc lai (total - lower_bound) / lower_bound, lower_bound = 1-tree
+    optimal: bool
+    # do dac: build_s, search_s (giay), callbacks (so lan goi distance_callback), status
+    stats: Dict[str, object] = field(default_factory=dict)
+
+
+def tour_length(d: np.ndarray, order: List[int]) -> int:
+    o = np.asarray(order, dtype=np.intp)
+    return int(d[o[:-1], o[1:]].sum())
+
+
+def arc_bound(d: np.ndarray) -> int:
+    """Can duoi re: moi node phai co 1 cung ra va 1 cung vao (bo duong cheo)."""
+    n = len(d)
+    if n < 2:
+        return 0
+    m = d.astype(np.int64, copy=True)
+    np.fill_diagonal(m, np.iinfo(np.int64).max)
+    return int(max(m.min(axis=1).sum(), m.min(axis=0).sum()))
+
+
+def _one_tree(w: np.ndarray) -> tuple[float, np.ndarray, np.ndarray]:
+    """
+    1-tree nho nhat (cay khung tren node 1..n-1 + 2 canh re nhat cua node 0) voi trong so canh
+    c[i, j] = min(w[i, j], w[j, i]). Tra ve (tong, bac ra, bac vao) khi moi canh tinh theo chieu re hon.
+    """
+    n = len(w)
+    c = np.minimum(w, w.T)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[:2] = True
+    key = c[1].copy()
+    key[:2] = np.inf
+    parent = np.ones(n, dtype=np.intp)
+    src = np.empty(n, dtype=np.intp)
+    dst = np.empty(n, dtype=np.intp)
+    # Prim O(n^2): moi buoc them node gan cay nhat
+    for e in range(n - 2):
+        v = int(np.where(in_tree, np.inf, key).argmin())
+        src[e], dst[e] = parent[v], v
+        in_tree[v] = True
+        closer = ~in_tree & (c[v] < key)
+        key[closer] = c[v, closer]
+        parent[closer] = v
+    a, b = np.argpartition(c[0, 1:], 1)[:2] + 1
+    src[n - 2:], dst[n - 2:] = 0, (a, b)
+    total = float(c[src, dst].sum())
+    fwd = w[src, dst] <= w[dst, src]
+    tails = np.where(fwd, src, dst)
+    heads = np.where(fwd, dst, src)
+    return total, np.bincount(tails, minlength=n), np.bincount(heads, minlength=n)
+
+
+def lower_bound(d: np.ndarray, upper: int | None = None, time_budget_s: float = BOUND_BUDGET_S) -> int:
+    """
+    Can duoi Held-Karp (Lagrange tren 1-tree) cho tour co huong: w = d + a[i] + b[j] khong doi thu tu
+    cac tour (moi tour cong dung sum(a) + sum(b)), va moi tour la mot 1-tree tren min(w, w.T), nen
+    1-tree(w) - sum(a) - sum(b) <= do dai moi tour voi bat ky a, b. a, b (phat bac ra / vao) cap nhat
+    bang subgradient toi khi het time_budget_s; ket qua khong bao gio kem hon arc_bound.
+    upper: do dai mot tour da biet (dung de chon buoc), mac dinh lay tour lang gieng gan nhat.
+    """
+    n = len(d)
+    base = arc_bound(d)
+    if n < 4:
+        return base
+    deadline = time.monotonic() + time_budget_s
+    m = np.asarray(d, dtype=np.float64).copy()
+    np.fill_diagonal(m, np.inf)
+    if upper is None:
+        upper = tour_length(d, nearest_neighbor(d, 0))
+    a = np.zeros(n)
+    b = np.zeros(n)
+    best = -np.inf
+    step_scale, stale = 2.0, 0
+    while step_scale > 1e-3:
+        total, out_deg, in_deg = _one_tree(m + a[:, None] + b[None, :])
+        value = total - a.sum() - b.sum()
+        if value > best + 1e-9:
+            best, stale = value, 0
+        else:
+            stale += 1
+            if stale >= 5:
+                step_scale, stale = step_scale / 2, 0
+        g_out = out_deg - 1
+        g_in = in_deg - 1
+        norm = float((g_out * g_out).sum() + (g_in * g_in).sum())
+        # norm = 0: 1-tree la mot tour -> can duoi dat (toi uu)
+        if norm == 0 or best >= upper or time.monotonic() >= deadline:
+            break
+        step = step_scale * max(upper - value, 1.0) / norm
+        a += step * g_out
+        b += step * g_in
+    # chi phi nguyen: lam tron len (tru sai so float)
+    return max(base, int(np.ceil(best - 1e-6)))
+
+
+def estimated_gap(lb: int, total: int) -> float | None:
+    if lb <= 0:
+        return None
+    return max(0.0, (total - lb) / lb)
+
+
+def pick_strategy(n: int) -> str:
+    if n <= EXACT_MAX_N:
+        return "exact"
+    if n <= LOCAL_MAX_N:
+        return "local"
+    return "ortools"
+
+
+# ---------- Held-Karp ----------
+def solve_exact(d: np.ndarray, start: int) -> tuple[list[int], int]:
+    """DP bitmask theo tung lop (so phan tu trong tap), vector hoa tren cac mask cung lop."""
+    n = len(d)
+    others = [i for i in range(n) if i != start]
+    m = len(others)
+    if m == 0:
+        return [start, start], 0
+
+    d = np.asarray(d, dtype=np.int64)
+    sub = d[np.ix_(others, others)]
+    from_start = d[start, others]
+    to_start = d[others, start]
+
+    full = 1 << m
+    inf = np.iinfo(np.int64).max // 4
+    bits = 1 << np.arange(m, dtype=np.int64)
+    masks = np.arange(full, dtype=np.int64)
+    popcount = ((masks[:, None] & bits[None, :]) != 0).sum(axis=1)
+
+    # dp[mask, k]: duong ngan nhat tu start qua dung cac node trong mask, ket thuc tai k
+    dp = np.full((full, m), inf, dtype=np.int64)
+    parent = np.full((full, m), -1, dtype=np.int8)
+    dp[bits, np.arange(m)] = from_start
+
+    for size in range(2, m + 1):
+        layer = masks[popcount == size]
+        for k in range(m):
+            sel = layer[(layer & bits[k]) != 0]
+            cand = dp[sel ^ bits[k]] + sub[:, k]
+            j = cand.argmin(axis=1)
+            dp[sel, k] = cand[np.arange(len(sel)), j]
+            parent[sel, k] = j
+
+    closing = dp[full - 1] + to_start
+    last = int(closing.argmin())
+    total = int(closing[last])
+
+    path = []
+    mask, k = full - 1, last
+    while k != -1:
+        path.append(others[k])
+        prev = int(parent[mask, k])
+        mask ^= 1 << k
+        k = prev
+    path.reverse()
+    return [start] + path + [start], total
+
+
+# ---------- 2-opt / Or-opt ----------
+def nearest_neighbor(d: np.ndarray, start: int) -> list[int]:
+    n = len(d)
+    seen = np.zeros(n, dtype=bool)
+    seen[start] = True
+    order = [start]
+    cur = start
+    for _ in range(n - 1):
+        # float + inf: an toan voi moi dtype (int32 khong chua duoc sentinel int64)
+        row = d[cur].astype(np.float64)
+        row[seen] = np.inf
+        cur = int(row.argmin())
+        seen[cur] = True
+        order.append(cur)
+    order.append(start)
+    return order
+
+
+def _best_two_opt(d: np.ndarray, t: np.ndarray) -> tuple[int, int, int]:
+    """Nuoc 2-opt tot nhat (dao doan t[i..j]), tra ve (delta, i, j)."""
+    n = len(t) - 1
+    if n < 4:
+        return 0, 0, 0
+    a = d[t[:-1], t[1:]]
+    b = d[t[1:], t[:-1]]
+    fwd = np.concatenate(([0], np.cumsum(a)))
+    bwd = np.concatenate(([0], np.cumsum(b)))
+
+    i = np.arange(1, n)[:, None]
+    j = np.arange(1, n)[None, :]
+    delta = (
+        d[t[i - 1], t[j]] + d[t[i], t[j + 1]] - a[i - 1] - a[j]
+        + (bwd[j] - bwd[i]) - (fwd[j] - fwd[i])
+    )
+    delta = np.where(j > i, delta, 0)
+    flat = int(delta.argmin())
+    bi, bj = divmod(flat, n - 1)
+    return int(delta[bi, bj]), bi + 1, bj + 1
+
+
+def _best_or_opt(d: np.ndarray, t: np.ndarray, seg_len: int) -> tuple[int, int, int]:
+    """Nuoc Or-opt tot nhat: chuyen doan t[i..i+L-1] sang sau t[k], tra ve (delta, i, k)."""
+    n = len(t) - 1
+    L = seg_len
+    if n < L + 2:
+        return 0, 0, 0
+    a = d[t[:-1], t[1:]]
+
+    i = np.arange(1, n - L + 1)[:, None]
+    k = np.arange(0, n)[None, :]
+    saving = a[i - 1] + a[i + L - 1] - d[t[i - 1], t[i + L]]
+    insert = d[t[k], t[i]] + d[t[i + L - 1], t[k + 1]] - a[k]
+    delta = insert - saving
+    delta = np.where((k >= i - 1) & (k <= i + L - 1), 0, delta)
+    flat = int(delta.argmin())
+    bi, bk = divmod(flat, n)
+    return int(delta[bi, bk]), bi + 1, bk
+
+
+def _apply_or_opt(t: np.ndarray, i: int, k: int, L: int) -> np.ndarray:
+    seg = t[i:i + L]
+    rest = np.concatenate((t[:i], t[i + L:]))
+    pos = k + 1 if k < i else k - L + 1
+    return np.concatenate((rest[:pos], seg, rest[pos:]))
+
+
+def local_search(
+    d: np.ndarray, order: List[int], deadline: float | None = None, should_cancel: ShouldCancel | None = None
+) -> list[int]:
+    """
+    Lap 2-opt + Or-opt (doan 1..3) den khi khong con nuoc cai thien
+    (hoac qua deadline theo time.monotonic(), hoac should_cancel() tra True).
+    order khong can phu het cac node cua d.
+    """
+    t = np.asarray(order, dtype=np.intp)
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            return t.tolist()
+        if should_cancel is not None and should_cancel():
+            return t.tolist()
+        delta, i, j = _best_two_opt(d, t)
+        if delta < 0:
+            t = np.concatenate((t[:i], t[i:j + 1][::-1], t[j + 1:]))
+            continue
+        for L in (1, 2, 3):
+            delta, i, k = _best_or_opt(d, t, L)
+            if delta < 0:
+                t = _apply_or_opt(t, i, k, L)
+                break
+        else:
+            return t.tolist()
+
+
+def _double_bridge(order: List[int], rng: np.random.Generator) -> list[int]:
+    n = len(order) - 1
+    p1, p2, p3 = sorted(rng.choice(np.arange(1, n), size=3, replace=False))
+    return order[:p1] + order[p2:p3] + order[p1:p2] + order[p3:]
+
+
+def solve_local(
+    d: np.ndarray,
+    start: int,
+    time_limit_s: float,
+    stall_s: float,
+    target_total: int | None = None,
+    on_improve: OnImprove | None = None,
+    should_cancel: ShouldCancel | None = None,
+    stats: Dict[str, object] | None = None,
+) -> tuple[list[int], int]:
+    """
+    Iterated local search: NN -> 2-opt/Or-opt, sau do kick double-bridge den het ngan sach.
+    Ca lan 2-opt/Or-opt dau tien cung dung theo time_limit_s / should_cancel (n lon co the mat hang chuc giay).
+    stats (neu co) nhan "status": ly do dung (LOCAL_OPTIMUM, TIME_LIMIT, STALL, TARGET_GAP, CANCELLED).
+    """
+    stats = {} if stats is None else stats
+    d = np.asarray(d, dtype=np.int64)
+    t0 = time.monotonic()
+    deadline = t0 + time_limit_s
+    best = local_search(d, nearest_neighbor(d, start), deadline, should_cancel)
+    best_total = tour_length(d, best)
+    if on_improve is not None:
+        on_improve(best, best_total)
+    stats["status"] = "LOCAL_OPTIMUM"
+    if len(best) < 9:
+        return best, best_total
+
+    rng = np.random.default_rng(0)
+    last_improve = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            stats["status"] = "TIME_LIMIT"
+            break
+        if now - last_improve >= stall_s:
+            stats["status"] = "STALL"
+            break
+        if target_total is not None and best_total <= target_total:
+            stats["status"] = "TARGET_GAP"
+            break
+        if should_cancel is not None and should_cancel():
+            stats["status"] = "CANCELLED"
+            break
+        cand = local_search(d, _double_bridge(best, rng), deadline, should_cancel)
+        cand_total = tour_length(d, cand)
+        if cand_total < best_total:
+            best, best_total = cand, cand_total
+            last_improve = time.monotonic()
+            if on_improve is not None:
+                on_improve(best, best_total)
+    return best, best_total
+
+
+# ---------- Sua tour co san (them / bot diem) ----------
+def cheapest_insertion(d: np.ndarray, order: List[int], nodes: List[int]) -> list[int]:
+    """Chen lan luot cac node vao vi tri re nhat; moi buoc chon cap (node, canh) re nhat toan cuc."""
+    t = list(order)
+    left = list(nodes)
+    while left:
+        o = np.asarray(t, dtype=np.intp)
+        x = np.asarray(left, dtype=np.intp)[:, None]
+        cost = d[o[:-1], x] + d[x, o[1:]] - d[o[:-1], o[1:]]
+        flat = int(cost.argmin())
+        bi, bk = divmod(flat, len(t) - 1)
+        t.insert(bk + 1, left.pop(bi))
+    return t
+
+
+def reoptimize(
+    d: np.ndarray, order: List[int], add: List[int], remove: List[int], time_limit_s: float = 0.05
+) -> list[int]:
+    """
+    Bo cac node trong remove khoi tour vong kin order, chen cac node trong add bang cheapest insertion,
+    roi chay 2-opt/Or-opt toi da time_limit_s giay. Node dau/cuoi (depot) giu nguyen.
+    """
+    deadline = time.monotonic() + time_limit_s
+    d = np.asarray(d, dtype=np.int64)
+    drop = set(remove)
+    t = [order[0]] + [x for x in order[1:-1] if x not in drop] + [order[-1]]
+    t = cheapest_insertion(d, t, [x for x in add if x not in t])
+    return local_search(d, t, deadline)
+
+
+# ---------- OR-Tools ----------
+def solve_ortools(
+    d: np.ndarray,
+    start: int,
+    time_limit_s: float,
+    stall_s: float,
+    target_total: int | None = None,
+    on_improve: OnImprove | None = None,
+    should_cancel: ShouldCancel | None = None,
+    stats: Dict[str, object] | None = None,
+) -> tuple[list[int], int]:
+    """
+    GLS voi gioi han thoi gian cung + dung som khi khong cai thien sau stall_s giay.
+    stats (neu co) nhan build_s, search_s, callbacks va status (RoutingSearchStatus cua OR-Tools).
+    """
+    stats = {} if stats is None else stats
+    t0 = time.perf_counter()
+    # list long nhau: truy cap trong callback nhanh hon index numpy
+    distance_matrix = np.asarray(d).tolist()
+
+    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), 1, start)
+    routing = pywrapcp.RoutingModel(manager)
+    calls = [0]
+
+    def distance_callback(from_index, to_index):
+        calls[0] += 1
+        f = manager.IndexToNode(from_index)
+        t = manager.IndexToNode(to_index)
+        return int(distance_matrix[f][t])
+
+    cb = routing.RegisterTransitCallback(distance_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(cb)
+
+    state = {"best": None, "at": None}
+
+    def current_order() -> list[int]:
+        # goi trong AtSolutionCallback: NextVar da duoc gan gia tri
+        index = routing.Start(0)
+        order = []
+        while not routing.IsEnd(index):
+            order.append(manager.IndexToNode(index))
+            index = routing.NextVar(index).Value()
+        order.append(manager.IndexToNode(index))
+        return order
+
+    def on_solution():
+        cost = routing.CostVar().Max()
+        if state["best"] is None or cost < state["best"]:
+            state["best"] = cost
+            state["at"] = time.monotonic()
+            if on_improve is not None:
+                on_improve(current_order(), int(cost))
+
+    def should_stop():
+        if state["at"] is None:
+            return False  # chua co loi giai dau tien
+        if should_cancel is not None and should_cancel():
+            return True
+        if target_total is not None and state["best"] <= target_total:
+            return True
+        return time.monotonic() - state["at"] >= stall_s
+
+    routing.AddAtSolutionCallback(on_solution)
+    routing.AddSearchMonitor(routing.solver().CustomLimit(should_stop))
+
+    search = pywrapcp.DefaultRoutingSearchParameters()
+    search.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    search.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    search.time_limit.FromMilliseconds(max(1, int(time_limit_s * 1000)))
+
+    stats["build_s"] = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    sol = routing.SolveWithParameters(search)
+    stats["search_s"] = time.perf_counter() - t1
+    stats["callbacks"] = calls[0]
+    stats["status"] = routing_enums_pb2.RoutingSearchStatus.Value.Name(routing.status())
+    if not sol:
+        return [], 0
+
+    index = routing.Start(0)
+    order: list[int] = []
+    while not routing.IsEnd(index):
+        order.append(manager.IndexToNode(index))
+        index = sol.Value(routing.NextVar(index))
+    order.append(manager.IndexToNode(index))
+    return order, tour_length(np.asarray(d), order)
+
+
+# ---------- Diem vao chung ----------
+def solve(
+    d: np.ndarray,
+    start: int,
+    time_limit_s: float = 10,
+    stall_s: float | None = None,
+    target_gap: float | None = None,
+    strategy: str = "auto",
+    on_improve: OnImprove | None = None,
+    should_cancel: ShouldCancel | None = None,
+) -> Tour:
+    """
+    Giai TSP vong kin tren ma tran d (N x N) xuat phat tu node start.
+    time_limit_s: tran thoi gian cho ca lan giai (gom ca tinh can duoi); stall_s: dung khi bao lau khong cai thien;
+    target_gap: dung khi (total - lower_bound) / lower_bound <= target_gap (lower_bound: xem lower_bound).
+    on_improve / should_cancel: xem OnImprove, ShouldCancel (exact chi bao ket qua cuoi).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown strategy {strategy!r}, expected one of {STRATEGIES}")
+    if time_limit_s <= 0:
+        raise ValueError(f"time_limit_s must be > 0, got {time_limit_s}")
+    if stall_s is not None and stall_s < 0:
+        raise ValueError(f"stall_s must be >= 0, got {stall_s}")
+    if target_gap is not None and target_gap < 0:
+        raise ValueError(f"target_gap must be >= 0, got {target_gap}")
+    d = np.asarray(d)
+    n = len(d)
+    if strategy == "auto":
+        strategy = pick_strategy(n)
+    if stall_s is None:
+        stall_s = DEFAULT_STALL_S
+
+    if strategy == "exact":
+        if n > EXACT_HARD_MAX_N:
+            raise ValueError(f"strategy 'exact' supports at most {EXACT_HARD_MAX_N} nodes, got {n}")
+        t0 = time.perf_counter()
+        order, total = solve_exact(d, start)
+        stats = {"search_s": time.perf_counter() - t0, "status": "OPTIMAL"}
+        if on_improve is not None:
+            on_improve(order, total)
+        return Tour(order, total, "exact", 0.0, True, stats)
+
+    # can duoi tinh truoc khi tim kiem: dung cho target_gap va cho gap bao cao
+    t0 = time.perf_counter()
+    lb = lower_bound(d, time_budget_s=min(BOUND_BUDGET_S, 0.1 * time_limit_s))
+    # tim kiem chi duoc phan con lai cua time_limit_s
+    search_limit_s = max(time_limit_s - (time.perf_counter() - t0), 0.001)
+    target_total = None
+    if target_gap is not None:
+        target_total = int(lb * (1 + target_gap))
+
+    stats: Dict[str, object] = {}
+    if strategy == "local":
+        t0 = time.perf_counter()
+        order, total = solve_local(
+            d, start, search_limit_s, stall_s, target_total, on_improve, should_cancel, stats
+        )
+        stats["search_s"] = time.perf_counter() - t0
+    else:
+        order, total = solve_ortools(
+            d, start, search_limit_s, stall_s, target_total, on_improve, should_cancel, stats
+        )
+    if not order:
+        return Tour([], 0, strategy, None, False, stats)
+    stats["lower_bound"] = lb
+    return Tour(order, total, strategy, estimated_gap(lb, total), lb >= total, stats)
@@ -0,0 +1,112 @@
+# spatial_index.py - Chi muc luoi (grid) tren toa do ATM cho truy van k gan nhat / trong ban kinh
+#
+# Toa do duoc chieu phang (equirectangular quanh vi do trung binh) roi chia o vuong cell_m met.
+# Du cho pham vi mot thanh pho; khoang cach tra ve van tinh bang haversine.
+
+from typing import Dict, List
+import math
+
+import numpy as np
+
+from matrix_builder import EARTH_RADIUS_M, Locations, haversine
+
+
+class SpatialIndex:
+    def __init__(self, ids: List[str], lat: np.ndarray, lon: np.ndarray, cell_m: float = 500.0):
+        """lat / lon la radian (nhu Locations)."""
+        self.ids = list(ids)
+        self.index = {x: i for i, x in enumerate(self.ids)}
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_m = cell_m
+        self._cos0 = math.cos(float(self.lat.mean())) if len(self.lat) else 1.0
+
+        cx, cy = self._cells(self.lat, self.lon)
+        self._cells_map: Dict[tuple[int, int], np.ndarray] = {}
+        if len(self.ids):
+            order = np.lexsort((cy, cx))
+            keys = np.stack((cx[order], cy[order]), axis=1)
+            starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+            for s, e in zip(starts, np.r_[starts[1:], len(order)]):
+                self._cells_map[(int(keys[s, 0]), int(keys[s, 1]))] = order[s:e]
+            self._lo = (int(cx.min()), int(cy.min()))
+            self._hi = (int(cx.max()), int(cy.max()))
+
+    @classmethod
+    def from_locations(cls, locations: Locations, cell_m: float = 500.0) -> "SpatialIndex":
+        return cls(locations.ids, locations.lat, locations.lon, cell_m)
+
+    def subset(self, want: List[str]) -> "SpatialIndex":
+        rows = np.fromiter((self.index[x] for x in want), dtype=np.intp, count=len(want))
+        return SpatialIndex(want, self.lat[rows], self.lon[rows], self.cell_m)
+
+    def _cells(self, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        x = EARTH_RADIUS_M * np.asarray(lon) * self._cos0
+        y = EARTH_RADIUS_M * np.asarray(lat)
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    def _ring(self, cx: int, cy: int, r: int) -> List[np.ndarray]:
+        """Cac nhom diem trong o co khoang cach Chebyshev dung bang r tinh tu (cx, cy)."""
+        (lox, loy), (hix, hiy) = self._lo, self._hi
+        out = []
+        # chi duyet phan vong nam trong khung bao cua luoi
+        for x in range(max(cx - r, lox), min(cx + r, hix) + 1):
+            if abs(x - cx) == r:
+                ys = range(max(cy - r, loy), min(cy + r, hiy) + 1)
+            else:
+                ys = [y for y in {cy - r, cy + r} if loy <= y <= hiy]
+            for y in ys:
+                found = self._cells_map.get((x, y))
+                if found is not None:
+                    out.append(found)
+        return out
+
+    def _reach(self, cx: int, cy: int) -> tuple[int, int]:
+        """(vong nho nhat, vong lon nhat) cham toi khung bao cua luoi tinh tu o (cx, cy)."""
+        (lox, loy), (hix, hiy) = self._lo, self._hi
+        r_min = max(lox - cx, cx - hix, loy - cy, cy - hiy, 0)
+        r_max = max(abs(cx - lox), abs(cx - hix), abs(cy - loy), abs(cy - hiy))
+        return r_min, r_max
+
+    def _distances(self, lat: float, lon: float, rows: np.ndarray) -> np.ndarray:
+        return haversine(np.array([lat]), np.array([lon]), self.lat[rows], self.lon[rows])[0]
+
+    def nearest(self, lat: float, lon: float, k: int, exclude: int | None = None) -> List[tuple[int, float]]:
+        """
+        k diem gan (lat, lon) nhat (radian), tra ve [(row, distance_m)] tang dan.
+        Mo rong tung vong o cho den khi diem thu k gan hon moi diem ngoai vong da xet.
+        """
+        if k <= 0 or not self.ids:
+            return []
+        cx, cy = (int(v[0]) for v in self._cells(np.array([lat]), np.array([lon])))
+        r, max_r = self._reach(cx, cy)
+        found: List[np.ndarray] = []
+        while True:
+            found.extend(self._ring(cx, cy, r))
+            rows = np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+            if exclude is not None:
+                rows = rows[rows != exclude]
+            if len(rows) >= k or r >= max_r:
+                dist = self._distances(lat, lon, rows)
+                # diem ngoai vong r cach it nhat r * cell_m tren mat phang chieu; 0.9 = du phong sai so chieu
+                if r >= max_r or np.partition(dist, k - 1)[k - 1] <= 0.9 * r * self.cell_m:
+                    break
+            r += 1
+        top = np.argsort(dist, kind="stable")[:k]
+        return [(int(rows[i]), float(dist[i])) for i in top]
+
+    def within(self, lat: float, lon: float, radius_m: float) -> List[tuple[int, float]]:
+        """Moi diem cach (lat, lon) (radian) khong qua radius_m, tra ve [(row, distance_m)] tang dan."""
+        if not self.ids:
+            return []
+        cx, cy = (int(v[0]) for v in self._cells(np.array([lat]), np.array([lon])))
+        r_min, r_max = self._reach(cx, cy)
+        reach = min(int(math.ceil(radius_m / self.cell_m)) + 1, r_max)
+        found = [rows for r in range(r_min, reach + 1) for rows in self._ring(cx, cy, r)]
+        if not found:
+            return []
+        rows = np.concatenate(found)
+        dist = self._distances(lat, lon, rows)
+        keep = np.flatnonzero(dist <= radius_m)
+        keep = keep[np.argsort(dist[keep], kind="stable")]
+        return [(int(rows[i]), float(dist[i])) for i in keep]
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import SolutionCache  # noqa: E402
+
+
+def entry(**kw):
+    base = {"time_limit_s": 10, "stall_s": 2.0, "target_gap": None, "optimal": False}
+    return {**base, **kw}
+
+
+def test_covers_same_or_looser_request():
+    e = entry()
+    assert SolutionCache.covers(e, 10, 2.0, None)
+    assert SolutionCache.covers(e, 5, 1.0, 0.05)
+
+
+def test_covers_rejects_stricter_request():
+    e = entry()
+    assert not SolutionCache.covers(e, 20, 2.0, None)
+    assert not SolutionCache.covers(e, 10, 5.0, None)
+
+
+def test_target_gap_result_is_not_a_full_solve():
+    e = entry(target_gap=0.5)
+    assert not SolutionCache.covers(e, 10, 2.0, None)
+    assert not SolutionCache.covers(e, 10, 2.0, 0.1)
+    assert SolutionCache.covers(e, 10, 2.0, 0.5)
+
+
+def test_optimal_result_covers_everything():
+    e = entry(time_limit_s=1, stall_s=0.0, target_gap=5.0, optimal=True)
+    assert SolutionCache.covers(e, 60, 10.0, None)
+
+
+def test_put_keeps_shorter_route_and_merges_budgets():
+    cache = SolutionCache(max_size=4)
+    key = SolutionCache.key("sha", 1, [1, 2, 3], "auto")
+    cache.put(key, ["1", "2", "3", "1"], 100, 10, 2.0, None, "STALL")
+    cache.put(key, ["1", "3", "2", "1"], 120, 20, 5.0, 0.05, "TARGET_GAP")
+    hit = cache.get(key, 20, 5.0, None)
+    assert hit is not None
+    assert hit["total"] == 100 and hit["route_ids"] == ["1", "2", "3", "1"]
+    assert cache.get(key, 30, 5.0, None) is None
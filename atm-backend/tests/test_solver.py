@@ -0,0 +1,110 @@
+import itertools
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import solver  # noqa: E402
+
+
+def random_matrix(n, seed, asymmetric=True):
+    """Points in a 10 km square; road-like asymmetry when asymmetric."""
+    rng = np.random.default_rng(seed)
+    p = rng.uniform(0, 10_000, (n, 2))
+    d = np.linalg.norm(p[:, None] - p[None, :], axis=2)
+    if asymmetric:
+        d *= rng.uniform(1.0, 1.4, (n, n))
+    d = d.astype(np.int64)
+    np.fill_diagonal(d, 0)
+    return d
+
+
+def brute_force(d, start):
+    others = [i for i in range(len(d)) if i != start]
+    best = None
+    for perm in itertools.permutations(others):
+        total = solver.tour_length(d, [start, *perm, start])
+        best = total if best is None else min(best, total)
+    return best
+
+
+def assert_valid_tour(d, start, order, total):
+    assert order[0] == order[-1] == start
+    assert sorted(order[:-1]) == list(range(len(d)))
+    assert total == solver.tour_length(d, order)
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 5, 6, 7, 8])
+def test_solve_exact_matches_brute_force(n):
+    for seed in range(5):
+        d = random_matrix(n, seed)
+        start = seed % n
+        order, total = solver.solve_exact(d, start)
+        assert_valid_tour(d, start, order, total)
+        assert total == brute_force(d, start)
+
+
+def test_lower_bound_never_exceeds_optimum():
+    for seed in range(60):
+        n = 4 + seed % 8
+        d = random_matrix(n, seed, asymmetric=seed % 2 == 0)
+        _, opt = solver.solve_exact(d, 0)
+        assert solver.arc_bound(d) <= solver.lower_bound(d) <= opt
+
+
+def test_lower_bound_on_int32_matrix():
+    # int32 is what MatrixStore / MatrixBuilder hand to the solver
+    d = random_matrix(10, 1)
+    _, opt = solver.solve_exact(d, 0)
+    assert solver.lower_bound(d.astype(np.int32)) <= opt
+
+
+@pytest.mark.parametrize("strategy", ["exact", "local", "ortools"])
+def test_strategies_return_valid_tours(strategy):
+    d = random_matrix(12, 3)
+    tour = solver.solve(d, 4, time_limit_s=1, stall_s=0.2, strategy=strategy)
+    assert tour.strategy == strategy
+    assert_valid_tour(d, 4, tour.order, tour.total)
+    assert tour.total >= solver.solve_exact(d, 4)[1]
+    assert tour.gap is not None and tour.gap >= 0
+
+
+def test_auto_picks_by_size_and_stays_valid():
+    for n, expected in [(8, "exact"), (40, "local"), (70, "ortools")]:
+        d = random_matrix(n, n)
+        tour = solver.solve(d, 0, time_limit_s=1, stall_s=0.2)
+        assert tour.strategy == expected
+        assert_valid_tour(d, 0, tour.order, tour.total)
+
+
+def test_local_search_moves_only_improve():
+    d = random_matrix(40, 7)
+    start = solver.nearest_neighbor(d, 0)
+    improved = solver.local_search(d, start)
+    assert_valid_tour(d, 0, improved, solver.tour_length(d, improved))
+    assert solver.tour_length(d, improved) <= solver.tour_length(d, start)
+    # local optimum: no 2-opt / Or-opt move with negative delta remains
+    t = np.asarray(improved)
+    assert solver._best_two_opt(d, t)[0] >= 0
+    for seg_len in (1, 2, 3):
+        assert solver._best_or_opt(d, t, seg_len)[0] >= 0
+
+
+def test_reoptimize_adds_and_removes_stops():
+    d = random_matrix(15, 5)
+    order = [0, 1, 2, 3, 4, 5, 0]
+    out = solver.reoptimize(d, order, add=[9, 11], remove=[2, 4])
+    assert out[0] == out[-1] == 0
+    assert sorted(out[:-1]) == [0, 1, 3, 5, 9, 11]
+
+
+def test_solve_rejects_bad_budgets():
+    d = random_matrix(20, 0)
+    with pytest.raises(ValueError):
+        solver.solve(d, 0, time_limit_s=0)
+    with pytest.raises(ValueError):
+        solver.solve(d, 0, stall_s=-1)
+    with pytest.raises(ValueError):
+        solver.solve(d, 0, target_gap=-0.1)
@@ -0,0 +1,150 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import routing
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "atm-backend"))
+import solver  # noqa: E402
+from matrix_builder import Locations, MatrixBuilder  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE = Path(__file__).resolve().parent
+BEST_FILE = BASE / "benchmark_best.json"
+
+SYNTHETIC_SIZES = (100, 200, 500, 1000, 2000)
+# inner Hanoi bounding box (degrees) and the detour factor fitted on the 3 route CSVs
+BBOX = (20.95, 21.10, 105.75, 105.90)
+DETOUR = 1.387
+
+
+# ---------- Instances ----------
+def synthetic_matrix(n, seed):
+    rng = np.random.default_rng(seed)
+    lat = np.radians(rng.uniform(BBOX[0], BBOX[1], n))
+    lon = np.radians(rng.uniform(BBOX[2], BBOX[3], n))
+    ids = [str(i) for i in range(n)]
+    locations = Locations(ids, {x: i for i, x in enumerate(ids)}, lat, lon, f"synthetic-{n}-{seed}")
+    return MatrixBuilder(locations, DETOUR).build(ids)
+
+
+def cases(sizes, seed):
+    """(name, spec) for the shipped route matrices and the synthetic instances."""
+    out = []
+    for name, info in routing.routes.items():
+        out.append((name, ("csv", info["file"], info["start_id"])))
+    for n in sizes:
+        out.append((f"synthetic-{n}", ("synthetic", n, seed)))
+    return out
+
+
+def load_case(spec):
+    if spec[0] == "csv":
+        ids, values = routing.load_matrix(BASE / spec[1])
+        return values, ids.index(str(spec[2]))
+    return synthetic_matrix(spec[1], spec[2]), 0
+
+
+# ---------- One run (in its own process, so peak RSS is per case) ----------
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KiB, macOS: bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(name, spec, time_limit_s, stall_s, strategy):
+    t0 = time.perf_counter()
+    matrix, start = load_case(spec)
+    load_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    tour = solver.solve(matrix, start, time_limit_s, stall_s, strategy=strategy)
+    return {
+        "case": name,
+        "n": len(matrix),
+        "solved": bool(tour.order),
+        "strategy": tour.strategy,
+        "status": tour.stats.get("status"),
+        "load_s": round(load_s, 4),
+        "solve_s": round(time.perf_counter() - t0, 4),
+        "total": tour.total,
+        "gap": tour.gap,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(name, spec, time_limit_s, stall_s, strategy):
+    """Fresh worker per case: ru_maxrss is a high-water mark and would carry over between cases."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(run_case, name, spec, time_limit_s, stall_s, strategy).result()
+
+
+# ---------- Compare ----------
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return {r["case"]: r for r in (json.loads(line) for line in f if line.strip())}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark solver.solve on the route matrices and synthetic 100-2000 node instances."
+    )
+    parser.add_argument("--time-limit", type=float, default=10, help="time limit per case (s)")
+    parser.add_argument("--stall", type=float, help="stop after this many seconds without improvement")
+    parser.add_argument("--strategy", default="auto", choices=solver.STRATEGIES)
+    parser.add_argument("--sizes", help="comma-separated synthetic sizes (default: %s)" % ",".join(map(str, SYNTHETIC_SIZES)))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSONL output file (default: stdout)")
+    parser.add_argument("--baseline", help="JSONL of an earlier run; flags cases that got slower or longer")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slack before a regression is flagged")
+    parser.add_argument("--update-best", action="store_true", help=f"record new best totals in {BEST_FILE.name}")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x] if args.sizes else SYNTHETIC_SIZES
+    best = json.loads(BEST_FILE.read_text(encoding="utf-8")) if BEST_FILE.exists() else {}
+    baseline = load_jsonl(args.baseline) if args.baseline else {}
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    regressions = []
+    try:
+        for name, spec in cases(sizes, args.seed):
+            r = run_isolated(name, spec, args.time_limit, args.stall, args.strategy)
+            known = best.get(name)
+            r["best_known"] = known
+            r["vs_best"] = round(r["total"] / known - 1, 6) if known and r["solved"] else None
+            if args.update_best and r["solved"] and (known is None or r["total"] < known):
+                best[name] = r["total"]
+            prev = baseline.get(name)
+            if prev and prev["solved"]:
+                slack = 1 + args.tolerance
+                if (
+                    not r["solved"]
+                    or r["total"] > prev["total"] * slack
+                    or r["solve_s"] > prev["solve_s"] * slack + 0.05
+                ):
+                    regressions.append(name)
+                    r["regression"] = {"total": prev["total"], "solve_s": prev["solve_s"]}
+            out.write(json.dumps(r) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.update_best:
+        BEST_FILE.write_text(json.dumps(best, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    if regressions:
+        print(f"regressions vs {args.baseline}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
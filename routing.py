@@ -1,75 +1,198 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
 
-# ---------- Function TSP solver ----------
-def solve_tsp(csv_file, start_node_id):
-    # Load distance matrix
-    df = pd.read_csv(csv_file, index_col=0)
-    ids = list(df.index.astype(str))
-    id_to_index = {id_: i for i, id_ in enumerate(ids)}
-
-    # Distance matrix as nested list
-    distance_matrix = df.values.tolist()
-
-    # Create routing index manager
-    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), 1, id_to_index[str(start_node_id)])
+# shared solver layer lives next to the backend (atm-backend/solver.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent / "atm-backend"))
+import solver  # noqa: E402
 
-    # Create routing model
-    routing = pywrapcp.RoutingModel(manager)
+BASE = Path(__file__).resolve().parent
 
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return int(distance_matrix[from_node][to_node])
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+# ---------- Load distance matrix ----------
+def load_matrix(csv_file):
+    df = pd.read_csv(csv_file, index_col=0)
+    ids = list(df.index.astype(str))
+    # Distance matrix as int array (same truncation as int() on each cell)
+    return ids, df.to_numpy(dtype=float).astype(int)
 
-    # Add constraint: return to start
-    # routing.SetDepot(id_to_index[str(start_node_id)])
 
-    # Search parameters
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    search_parameters.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-    search_parameters.time_limit.seconds = 10
+# ---------- Function TSP solver ----------
+def solve_tsp(csv_file, start_node_id, time_limit_s=10, strategy="auto"):
+    ids, distance_matrix = load_matrix(csv_file)
+    id_to_index = {id_: i for i, id_ in enumerate(ids)}
 
-    # Solve
-    solution = routing.SolveWithParameters(search_parameters)
+    # Exact DP / local search / OR-Tools picked by size, see solver.py
+    tour = solver.solve(distance_matrix, id_to_index[str(start_node_id)], time_limit_s, strategy=strategy)
 
-    if not solution:
+    if not tour.order:
         print(f"No solution for {csv_file}")
         return None
 
-    # Extract route
-    index = routing.Start(0)
-    route_ids = []
-    route_distance = 0
-    while not routing.IsEnd(index):
-        node = manager.IndexToNode(index)
-        route_ids.append(ids[node])
-        previous_index = index
-        index = solution.Value(routing.NextVar(index))
-        route_distance += routing.GetArcCostForVehicle(previous_index, index, 0)
-
-    # add depot again
-    route_ids.append(ids[manager.IndexToNode(index)])
+    route_ids = [ids[i] for i in tour.order]
+    print(f"   strategy = {tour.strategy}, gap = {tour.gap}")
 
-    return route_ids, route_distance
+    return route_ids, tour.total
 
 
-# ---------- Run for each route ----------
 routes = {
     "Tuyen1": {"file": "Distance_Matrix_Tuyến1.csv", "start_id": 1},
     "Tuyen2": {"file": "Distance_Matrix_Tuyến2.csv", "start_id": 2},
     "Tuyen3": {"file": "Distance_Matrix_Tuyến3.csv", "start_id": 3},
 }
 
-for name, info in routes.items():
-    result = solve_tsp(info["file"], info["start_id"])
-    if result:
-        path, dist = result
-        print(f"✅ {name}:")
-        print(" -> ".join(path))
-        print(f"Total distance = {dist/1000:.2f} km\n")
+
+# ---------- Batch scenarios ----------
+# file -> (ids, id_to_index, matrix); set once per worker process by _init_worker
+_MATRICES = {}
+
+
+def _init_worker(matrices):
+    global _MATRICES
+    _MATRICES = matrices
+
+
+def _get_matrix(csv_name):
+    if csv_name not in _MATRICES:
+        ids, values = load_matrix(BASE / csv_name)
+        _MATRICES[csv_name] = (ids, {id_: i for i, id_ in enumerate(ids)}, values)
+    return _MATRICES[csv_name]
+
+
+def _to_id(s):
+    try:
+        return int(s)
+    except ValueError:
+        return s
+
+
+def solve_scenario(index, scenario):
+    """
+    Solve one what-if scenario (same shape as a /solve_csv_selected body:
+    routes, optional depots / files / time_limit_s / stall_s / target_gap / strategy).
+    Returns {"index", "id", "results"}; a bad route only gets an "error" entry.
+    """
+    files = scenario.get("files") or {}
+    depots = scenario.get("depots") or {}
+    results = {}
+    for name, picked in scenario.get("routes", {}).items():
+        default = routes.get(name, {})
+        csv_name = files.get(name, default.get("file"))
+        depot_id = depots.get(name, default.get("start_id"))
+        if not picked or not csv_name or depot_id is None:
+            continue
+        try:
+            ids, id_to_index, values = _get_matrix(csv_name)
+            want = [str(depot_id)] + [str(x) for x in dict.fromkeys(picked) if x != depot_id]
+            missing = [x for x in want if x not in id_to_index]
+            if missing:
+                raise ValueError(f"IDs not in CSV index: {missing}")
+            idx = np.array([id_to_index[x] for x in want], dtype=np.intp)
+            tour = solver.solve(
+                values[np.ix_(idx, idx)],
+                0,
+                scenario.get("time_limit_s", 10),
+                scenario.get("stall_s"),
+                scenario.get("target_gap"),
+                scenario.get("strategy", "auto"),
+            )
+        except (OSError, ValueError) as e:
+            results[name] = {"order_ids": [], "total_distance_m": 0, "error": f"{type(e).__name__}: {e}"}
+            continue
+        results[name] = {
+            "order_ids": [_to_id(want[i]) for i in tour.order],
+            "total_distance_m": tour.total,
+            "strategy": tour.strategy,
+            "gap": tour.gap,
+            "optimal": tour.optimal,
+        }
+    return {"index": index, "id": scenario.get("id", index), "results": results}
+
+
+def run_batch(lines, out, workers, window=None):
+    """
+    Solve JSONL scenarios across a process pool and write one JSONL result per scenario
+    as soon as it finishes. At most `window` scenarios are in flight, so memory does not
+    grow with the number of scenarios; the default matrices are loaded once and handed
+    to each worker at start-up.
+    """
+    window = window or 2 * workers
+    matrices = {}
+    for info in routes.values():
+        ids, values = load_matrix(BASE / info["file"])
+        matrices[info["file"]] = (ids, {id_: i for i, id_ in enumerate(ids)}, values)
+
+    def emit(record):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def emit_done(fut, index, scenario_id):
+        # one failing scenario (e.g. BrokenProcessPool, an OR-Tools error) must not lose the whole batch
+        try:
+            emit(fut.result())
+        except Exception as e:
+            emit({"index": index, "id": scenario_id, "error": f"{type(e).__name__}: {e}"})
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrices,)) as pool:
+        # future -> (index, id), so errors are reported against the right scenario
+        pending = {}
+        index = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                scenario = json.loads(line)
+                if not isinstance(scenario, dict):
+                    raise ValueError(f"expected a JSON object, got {type(scenario).__name__}")
+            except ValueError as e:
+                emit({"index": index, "id": index, "error": f"invalid scenario: {e}"})
+                index += 1
+                continue
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    emit_done(fut, *pending.pop(fut))
+            pending[pool.submit(solve_scenario, index, scenario)] = (index, scenario.get("id", index))
+            index += 1
+        for fut in as_completed(pending):
+            emit_done(fut, *pending[fut])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve the ATM routes, or a batch of what-if scenarios.")
+    parser.add_argument("--batch", help="JSONL file of scenarios ('-' = stdin)")
+    parser.add_argument("--out", help="JSONL output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--window", type=int, help="max scenarios in flight (default: 2 x workers)")
+    args = parser.parse_args()
+
+    if args.batch:
+        src = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+        out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            run_batch(src, out, args.workers, args.window)
+        finally:
+            if src is not sys.stdin:
+                src.close()
+            if out is not sys.stdout:
+                out.close()
+        return
+
+    # ---------- Run for each route ----------
+    for name, info in routes.items():
+        result = solve_tsp(BASE / info["file"], info["start_id"])
+        if result:
+            path, dist = result
+            print(f"✅ {name}:")
+            print(" -> ".join(path))
+            print(f"Total distance = {dist/1000:.2f} km\n")
+
+
+if __name__ == "__main__":
+    main()